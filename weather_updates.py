@@ -1,16 +1,55 @@
+import orjson
 import requests
-import smtplib
+from cachetools import TLRUCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 
 
 # --- Constants ---
 API_BASE_URL = "https://api.open-meteo.com/v1/forecast"
 SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 465
+SMTP_TIMEOUT = 30  # seconds, so a silently dropped connection cannot stall a send
 EMAIL_SUBJECT = "Your Daily Weather Forecast"
 EMAIL_GREETING = "Good morning!\n\nHere is your daily weather forecast:\n\n"
+DAILY_SEND_HOUR = 7  # local hour for the daily send in daemon mode
+REPORT_TIMEZONE = ZoneInfo("America/New_York")
+MAX_FAILURE_RATIO = 1 / 3  # skip the send if more locations than this fail
+MIN_FAILURE_SAMPLE = 3  # locations needed before MAX_FAILURE_RATIO applies
+REPORT_RETRY_ATTEMPTS = 4  # daemon attempts per day before skipping the send
+REPORT_RETRY_DELAY = 15 * 60  # seconds between daemon attempts
+HTTP_TIMEOUT = (3.05, 10)  # (connect, read) seconds, so a stalled peer cannot hang the run
+
+# Shared HTTP session so every forecast request reuses the same
+# keep-alive connection pool to the API host. Transient gateway errors are
+# retried with a short backoff rather than failing the whole report.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    # Ignore Retry-After so a 503 cannot stretch a retry into an unbounded wait
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        respect_retry_after_header=False,
+    ),
+))
+SESSION.headers.update({"Accept-Encoding": "gzip", "Connection": "keep-alive"})
+
+# Forecasts are served from memory until they expire. Each entry is a
+# (ttl, weather_data) pair whose TTL comes from the API's Cache-Control
+# max-age, falling back to WEATHER_CACHE_TTL when none is sent.
+WEATHER_CACHE_TTL = 900  # seconds
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+_NO_CACHE_RE = re.compile(r"\bno-(?:store|cache)\b")
+_WEATHER_CACHE = TLRUCache(maxsize=128, ttu=lambda _key, entry, now: now + entry[0])
 
 
 # --- Configuration ---
@@ -56,9 +95,18 @@ WMO_CODES = {
     99: "Thunderstorm with heavy hail",
 }
 
+UNKNOWN_WEATHER_CODE = "Unknown weather code"
+
+# WMO codes are small non-negative integers, so a tuple indexed by code
+# replaces the dict lookup on the hot path.
+_WMO_TABLE = tuple(WMO_CODES.get(code, UNKNOWN_WEATHER_CODE) for code in range(100))
+
 def get_weather_description(wmo_code):
     """Returns a human-readable description for a WMO weather code."""
-    return WMO_CODES.get(wmo_code, "Unknown weather code")
+    if isinstance(wmo_code, int) and 0 <= wmo_code < len(_WMO_TABLE):
+        return _WMO_TABLE[wmo_code]
+    # Non-int codes (e.g. 3.0) still resolve through the dict as before
+    return WMO_CODES.get(wmo_code, UNKNOWN_WEATHER_CODE)
 
 locations = {
     "Naples, FL": {"latitude": 26.1420, "longitude": -81.7948},
@@ -66,44 +114,94 @@ locations = {
 }
 
 # --- Function to get the weather forecast ---
-def get_weather(lat, lon):
-    """Gets the weather forecast for a given latitude and longitude.
+# Request parameters shared by every forecast call; only the coordinates vary.
+_PARAMS_TEMPLATE = {
+    "daily": "temperature_2m_max,temperature_2m_min,weathercode,precipitation_sum,precipitation_probability_max",
+    "current_weather": "true",
+    "temperature_unit": "fahrenheit",
+    "timezone": "America/New_York"
+}
+
+def _extract_weather(data):
+    """Extracts today's forecast from a single Open-Meteo location result."""
+    daily = data["daily"]
+    return {
+        "current_temp": data["current_weather"]["temperature"],
+        "max_temp": daily["temperature_2m_max"][0],
+        "min_temp": daily["temperature_2m_min"][0],
+        "weather_code": daily["weathercode"][0],
+        "precipitation_sum": daily["precipitation_sum"][0],
+        "precipitation_probability_max": daily["precipitation_probability_max"][0]
+    }
+
+def _cache_key(coords):
+    """Returns the forecast cache key for a latitude/longitude pair."""
+    return (round(coords["latitude"], 4), round(coords["longitude"], 4))
+
+def _cache_ttl(response):
+    """Returns the cache lifetime in seconds advertised by a response.
+
+    Responses marked no-store or no-cache get a lifetime of 0.
+    """
+    cache_control = response.headers.get("Cache-Control", "").lower()
+    if _NO_CACHE_RE.search(cache_control):
+        return 0
+    match = _MAX_AGE_RE.search(cache_control)
+    return int(match.group(1)) if match else WEATHER_CACHE_TTL
+
+def get_weather_batch(locations):
+    """Gets the weather forecast for several locations in a single request.
+
+    Locations with a fresh entry in the forecast cache are not re-requested;
+    new results are cached for the max-age the API advertises.
 
     Args:
-        lat: The latitude of the location.
-        lon: The longitude of the location.
+        locations: A dictionary where keys are location names and values are
+                   dictionaries with "latitude" and "longitude".
 
     Returns:
-        A dictionary containing the weather forecast, or None if the
-        request fails.
+        A list of weather forecast dictionaries in the same order as
+        locations. Entries are None for locations that were not cached
+        and could not be retrieved.
     """
+    keys = [_cache_key(coords) for coords in locations.values()]
+    forecasts = {}
+    for key in keys:
+        entry = _WEATHER_CACHE.get(key)
+        if entry is not None:
+            forecasts[key] = entry[1]
+    missing = [key for key in dict.fromkeys(keys) if key not in forecasts]
+    if not missing:
+        return [forecasts[key] for key in keys]
+
     base_url = API_BASE_URL
     params = {
-        "latitude": lat,
-        "longitude": lon,
-        "daily": "temperature_2m_max,temperature_2m_min,weathercode,precipitation_sum,precipitation_probability_max",
-        "current_weather": True,
-        "temperature_unit": "fahrenheit",
-        "timezone": "America/New_York"
+        **_PARAMS_TEMPLATE,
+        "latitude": ",".join(f"{lat}" for lat, _ in missing),
+        "longitude": ",".join(f"{lon}" for _, lon in missing),
     }
     try:
-        response = requests.get(base_url, params=params)
+        response = SESSION.get(base_url, params=params, timeout=HTTP_TIMEOUT)
         response.raise_for_status()  # Raises an exception for bad status codes
-        data = response.json()
-
-        # Extract today's forecast
-        weather_data = {
-            "current_temp": data["current_weather"]["temperature"],
-            "max_temp": data["daily"]["temperature_2m_max"][0],
-            "min_temp": data["daily"]["temperature_2m_min"][0],
-            "weather_code": data["daily"]["weathercode"][0],
-            "precipitation_sum": data["daily"]["precipitation_sum"][0],
-            "precipitation_probability_max": data["daily"]["precipitation_probability_max"][0]
-        }
-        return weather_data
-    except requests.exceptions.RequestException as e:
+        data = orjson.loads(response.content)
+
+        # A single coordinate pair yields one object rather than a list
+        if isinstance(data, dict):
+            data = [data]
+        if len(data) != len(missing):
+            raise ValueError(f"expected {len(missing)} forecasts, got {len(data)}")
+        fetched = [_extract_weather(item) for item in data]
+    except (requests.exceptions.RequestException, ValueError, KeyError, IndexError, TypeError) as e:
+        # orjson.JSONDecodeError is a ValueError; the others mean a malformed payload
         print(f"Could not retrieve weather: {e}")
-        return None
+        return [forecasts.get(key) for key in keys]
+
+    ttl = _cache_ttl(response)
+    for key, weather_data in zip(missing, fetched):
+        forecasts[key] = weather_data
+        if ttl > 0:
+            _WEATHER_CACHE[key] = (ttl, weather_data)
+    return [forecasts[key] for key in keys]
 
 # --- Email and Weather Functions ---
 def build_weather_report(locations):
@@ -114,43 +212,138 @@ def build_weather_report(locations):
                    dictionaries with "latitude" and "longitude".
 
     Returns:
-        A formatted string with the weather report for all locations.
+        A formatted string with the weather report for all locations, or
+        None if no location could be retrieved, or if at least
+        MIN_FAILURE_SAMPLE locations were requested and more than
+        MAX_FAILURE_RATIO of them could not be retrieved.
     """
-    report = EMAIL_GREETING
-    for location, coords in locations.items():
-        weather_data = get_weather(coords["latitude"], coords["longitude"])
+    if not locations:
+        return EMAIL_GREETING
+
+    # One request covers every location; results come back in input order.
+    results = get_weather_batch(locations)
+
+    # A mostly-empty report is not worth sending; the API is likely down.
+    failures = sum(1 for weather_data in results if not weather_data)
+    too_many_failures = (
+        len(results) >= MIN_FAILURE_SAMPLE and failures / len(results) > MAX_FAILURE_RATIO
+    )
+    if failures == len(results) or too_many_failures:
+        print(f"Could not retrieve weather for {failures} of {len(results)} locations.")
+        return None
+
+    parts = [EMAIL_GREETING]
+    for location, weather_data in zip(locations, results):
         if weather_data:
-            report += f"{location}:\n"
-            report += f"  Current Temp: {weather_data['current_temp']}°F\n"
-            report += f"  High: {weather_data['max_temp']}°F | Low: {weather_data['min_temp']}°F\n"
+            parts.append(f"{location}:\n")
+            parts.append(f"  Current Temp: {weather_data['current_temp']}°F\n")
+            parts.append(f"  High: {weather_data['max_temp']}°F | Low: {weather_data['min_temp']}°F\n")
 
             precipitation_prob = weather_data['precipitation_probability_max']
             if precipitation_prob > 0:
                 weather_desc = get_weather_description(weather_data['weather_code'])
-                report += f"  Precipitation: {weather_desc} ({precipitation_prob}% chance)\n"
-                report += f"  Total Precipitation: {weather_data['precipitation_sum']}mm\n"
-            report += "\n"
+                parts.append(f"  Precipitation: {weather_desc} ({precipitation_prob}% chance)\n")
+                parts.append(f"  Total Precipitation: {weather_data['precipitation_sum']}mm\n")
+            parts.append("\n")
         else:
-            report += f"{location}: Could not retrieve weather data.\n\n"
-    return report
+            parts.append(f"{location}: Could not retrieve weather data.\n\n")
+    return "".join(parts)
 
-def send_email(email_body):
-    """Sends an email with the given body to the configured recipients.
+def _serialize(email_body, recipients):
+    """Builds the email message and returns it serialized to bytes.
 
     Args:
-        email_body: The body of the email to be sent.
+        email_body: The body of the email.
+        recipients: A list of recipient email addresses.
+
+    Returns:
+        The raw message bytes, ready to pass to SMTP.sendmail.
     """
-    msg = MIMEMultipart()
+    from email.mime.text import MIMEText
+
+    # A single plain-text part needs no multipart envelope
+    msg = MIMEText(email_body, 'plain', 'utf-8')
     msg['From'] = sender_email
     msg['To'] = ", ".join(recipients)
     msg['Subject'] = EMAIL_SUBJECT
+    return msg.as_bytes()
+
+class SmtpSender:
+    """Keeps one authenticated SMTP_SSL connection open across sends.
+
+    The connection is opened on the first send and closed when the
+    context manager exits. Before each later send the connection is
+    checked with NOOP and re-established if the server has dropped it.
+    Gmail closes idle sessions within minutes, so in daemon mode each
+    daily send normally reconnects.
+    """
+
+    def __init__(self):
+        self.server = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connect(self):
+        """Opens and authenticates a new SMTP_SSL connection."""
+        import smtplib
+
+        self.close()
+        self.server = smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        self.server.login(sender_email, password)
+
+    def close(self):
+        """Closes the SMTP connection if one is open."""
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except OSError:  # includes smtplib.SMTPException
+            self.server.close()
+        self.server = None
+
+    def _ensure_connected(self):
+        if self.server is None:
+            self.connect()
+            return
+        try:
+            self.server.noop()
+        except OSError:  # includes smtplib.SMTPException
+            self.connect()
+
+    def send(self, email_body, recipients):
+        """Sends an email with the given body over the open connection.
+
+        Args:
+            email_body: The body of the email to be sent.
+            recipients: A list of recipient email addresses.
+        """
+        raw_message = _serialize(email_body, recipients)
+        self._ensure_connected()
+        self.server.sendmail(sender_email, recipients, raw_message)
+
+def send_email(email_body, sender=None):
+    """Sends an email with the given body to the configured recipients.
+
+    Args:
+        email_body: The body of the email to be sent.
+        sender: An optional SmtpSender whose connection is reused. If not
+                given, a connection is opened for this send only.
+    """
+    # smtplib is imported here rather than at module level to keep it
+    # off the script's startup path when no report is sent.
+    import smtplib
 
-    msg.attach(MIMEText(email_body, 'plain'))
 
     try:
-        with smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT) as server:
-            server.login(sender_email, password)
-            server.sendmail(sender_email, recipients, msg.as_string())
+        if sender is None:
+            with SmtpSender() as one_shot:
+                one_shot.send(email_body, recipients)
+        else:
+            sender.send(email_body, recipients)
         print("Email sent successfully!")
     except smtplib.SMTPAuthenticationError:
         print("Error: SMTP authentication failed. Check your SENDER_EMAIL and EMAIL_PASSWORD.")
@@ -159,7 +352,72 @@ def send_email(email_body):
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 
+def _next_send_time(after):
+    """Returns the first daily send time strictly after the given time.
+
+    The send hour is applied in REPORT_TIMEZONE, so it stays at the same
+    local hour across daylight saving changes.
+    """
+    local = after.astimezone(REPORT_TIMEZONE)
+    next_send = local.replace(hour=DAILY_SEND_HOUR, minute=0, second=0, microsecond=0)
+    if next_send <= local:
+        next_send += timedelta(days=1)
+    return next_send
+
+def _sleep_until(target):
+    """Sleeps until the given aware datetime has passed."""
+    while True:
+        # Subtract in UTC; datetimes sharing a zone subtract as wall-clock time
+        remaining = (target.astimezone(timezone.utc) - datetime.now(timezone.utc)).total_seconds()
+        if remaining <= 0:
+            return
+        time.sleep(remaining)
+
+def _build_report_with_retries():
+    """Builds the weather report, retrying after a delay if it is skipped.
+
+    Returns:
+        The weather report, or None if every attempt failed.
+    """
+    for attempt in range(1, REPORT_RETRY_ATTEMPTS + 1):
+        weather_report = build_weather_report(locations)
+        if weather_report is not None:
+            return weather_report
+        if attempt < REPORT_RETRY_ATTEMPTS:
+            print(f"Retrying in {REPORT_RETRY_DELAY // 60} minutes.")
+            time.sleep(REPORT_RETRY_DELAY)
+    return None
+
+def run_daemon():
+    """Sends the weather report once a day, reusing one SMTP sender.
+
+    Intended for a long-lived process (e.g. a systemd service) instead of
+    a cron job. The first report is sent at the next DAILY_SEND_HOUR, not
+    on startup, so a restart does not send a duplicate. Send times missed
+    while the process was suspended or stalled are skipped rather than
+    sent back to back.
+    """
+    next_send = _next_send_time(datetime.now(timezone.utc))
+    with SmtpSender() as sender:
+        while True:
+            _sleep_until(next_send)
+            try:
+                weather_report = _build_report_with_retries()
+                if weather_report is None:
+                    print("Skipping today's email.")
+                else:
+                    send_email(weather_report, sender)
+            except Exception as e:
+                print(f"An unexpected error occurred: {e}")
+            next_send = _next_send_time(max(next_send, datetime.now(timezone.utc)))
+
 # --- Main Execution ---
 if __name__ == "__main__":
-    weather_report = build_weather_report(locations)
-    send_email(weather_report)
+    if "--daemon" in sys.argv[1:]:
+        run_daemon()
+    else:
+        weather_report = build_weather_report(locations)
+        if weather_report is None:
+            print("Not sending a weather report.")
+            sys.exit(1)
+        send_email(weather_report)